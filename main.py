@@ -1,48 +1,247 @@
-import os
+import io
+import posixpath
+import sys
 import tarfile
+from collections import deque
 import json
+import mmap
 import argparse
-import shutil
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LOG_BUFFER_SIZE = 64 * 1024
+TAR_BUFFER_SIZE = 128 * 1024
+# Archives whose regular files add up to at most this many bytes are
+# loaded into memory at startup.
+SMALL_ARCHIVE_SIZE = 64 * 1024 * 1024
+# Nesting limit when resolving links; deeper chains are treated as loops.
+MAX_LINK_DEPTH = 40
+
+# Explicit seekable open modes by file extension; other extensions, and
+# archives whose contents do not match their extension, fall back to
+# tarfile's auto-detection.
+TAR_MODES = {
+    ".tar": "r:",
+    ".gz": "r:gz",
+    ".tgz": "r:gz",
+    ".bz2": "r:bz2",
+    ".tbz2": "r:bz2",
+    ".xz": "r:xz",
+    ".txz": "r:xz",
+}
+
 
 class ShellEmulator:
+    # Command name -> index into self._command_handlers.
+    _COMMAND_IDS = {"ls": 0, "cd": 1, "rmdir": 2, "tail": 3, "exit": 4}
+    _EXIT = _COMMAND_IDS["exit"]
+
     def __init__(self, username, tar_path, log_file, start_script):
         self.username = username
         self.tar_path = tar_path
         self.log_file = log_file
         self.start_script = start_script
         self.current_dir = "."
-        self.virtual_fs_root = "./virtual_fs"
-        self.log_data = []
+        # Only current_dir changes between prompts.
+        self._prompt_prefix = username + ":"
+        self._prompt_suffix = "$ "
+        # exit has no handler: it is handled by the interactive loop.
+        self._command_handlers = (self.ls, self.cd, self.rmdir, self.tail, None)
+
+        # Virtual file system index: normalized path -> TarInfo, and
+        # directory path -> TarInfo of its direct children sorted by name
+        # (siblings share the parent prefix, so that is their base name).
+        self._entries = {}
+        self._dirs = {}
+        # Contents of regular files, kept only for small archives.
+        self._files = {}
+        self._raw = None
+        self._tar = None
+        self._mm = None
 
         self._prepare_virtual_fs()
 
+        # Opened only once the archive is indexed, so a bad archive leaves
+        # the previous log intact. Entries are written through a buffered
+        # handle as they happen; it is flushed and closed on exit.
+        self._log_fh = open(self.log_file, "wb", buffering=LOG_BUFFER_SIZE)
+
     def _prepare_virtual_fs(self):
-        if os.path.exists(self.virtual_fs_root):
-            shutil.rmtree(self.virtual_fs_root)
-        os.mkdir(self.virtual_fs_root)
+        self._entries = {}
+        self._dirs = {".": []}
+        self._files = {}
 
-        with tarfile.open(self.tar_path, "r") as tar:
-            tar.extractall(self.virtual_fs_root)
+        # tarfile reads 512-byte headers and seeks between them; a large
+        # buffer on the source file serves many headers per read() call.
+        self._raw = open(self.tar_path, "rb", buffering=TAR_BUFFER_SIZE)
+        try:
+            self._index_archive()
+        except Exception:
+            self._close_archive()
+            raise
 
-    def _log_action(self, action, details=None):
-        entry = {"user": self.username, "action": action, "details": details}
-        self.log_data.append(entry)
+    def _index_archive(self):
+        mode = TAR_MODES.get(Path(self.tar_path).suffix.lower(), "r")
+        try:
+            self._tar = tarfile.open(fileobj=self._raw, mode=mode)
+        except tarfile.ReadError:
+            if mode == "r":
+                raise
+            # The extension does not match the contents; let tarfile
+            # detect the format instead.
+            self._raw.seek(0)
+            self._tar = tarfile.open(fileobj=self._raw, mode="r")
+        for member in self._tar.getmembers():
+            self._add_entry(member)
+
+        # The tree only shrinks after this point (rmdir), so children are
+        # sorted once here and ls can print them in stored order.
+        for children in self._dirs.values():
+            children.sort(key=lambda entry: entry.name)
+
+        # Small archives are read into memory in one sequential pass and
+        # closed; larger ones stay open and members are read on demand.
+        members = [member for member in self._entries.values() if member.isreg()]
+        if sum(member.size for member in members) <= SMALL_ARCHIVE_SIZE:
+            for member in sorted(members, key=lambda entry: entry.offset_data):
+                with self._tar.extractfile(member) as f:
+                    self._files[member.name] = f.read()
+            self._close_archive()
+        elif self._tar.fileobj is self._raw:
+            # Uncompressed archive: member data is sliced straight out of a
+            # read-only memory map at the offsets recorded in the index.
+            self._mm = mmap.mmap(self._raw.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _add_entry(self, member):
+        key = posixpath.normpath(member.name.lstrip("/"))
+        if key == "." or key == ".." or key.startswith("../"):
+            return
+
+        parent = posixpath.dirname(key) or "."
+        self._ensure_dir(parent)
 
-    def _write_log(self):
-        with open(self.log_file, "w") as log_file:
-            json.dump(self.log_data, log_file, indent=4)
+        previous = self._entries.get(key)
+        if previous is not None:
+            self._dirs[parent].remove(previous)
+            if not member.isdir():
+                self._dirs.pop(key, None)
+
+        member.name = key
+        self._entries[key] = member
+        self._dirs[parent].append(member)
+        if member.isdir():
+            self._dirs.setdefault(key, [])
+
+    def _ensure_dir(self, key):
+        if key in self._dirs:
+            return
 
-    def _get_real_path(self, path):
-        if not path.startswith("/"):
-            path = os.path.join(self.current_dir, path)
-        return os.path.normpath(os.path.join(self.virtual_fs_root, path.strip("/")))
+        parent = posixpath.dirname(key) or "."
+        self._ensure_dir(parent)
+
+        # Archives may omit entries for intermediate directories.
+        member = tarfile.TarInfo(key)
+        member.type = tarfile.DIRTYPE
+        self._entries[key] = member
+        self._dirs[parent].append(member)
+        self._dirs[key] = []
+
+    def _resolve_path(self, path, follow_last=True, depth=0):
+        # Follows hard and symbolic links in every component of an index
+        # key (the last one only if follow_last). Hard link targets are
+        # relative to the archive root, symbolic ones to the link's
+        # directory. Returns None if a link escapes the root or links nest
+        # deeper than MAX_LINK_DEPTH, which is how loops end.
+        if path == ".":
+            return path
+
+        resolved = "."
+        parts = path.split("/")
+        for i, part in enumerate(parts):
+            current = part if resolved == "." else f"{resolved}/{part}"
+            member = self._entries.get(current)
+            if (
+                member is not None
+                and (member.islnk() or member.issym())
+                and (follow_last or i < len(parts) - 1)
+            ):
+                if depth >= MAX_LINK_DEPTH:
+                    return None
+                target = member.linkname
+                if member.issym() and not target.startswith("/"):
+                    target = f"{resolved}/{target}"
+                target = posixpath.normpath(target.lstrip("/") or ".")
+                if target == ".." or target.startswith("../"):
+                    return None
+                current = self._resolve_path(target, depth=depth + 1)
+                if current is None:
+                    return None
+            resolved = current
+        return resolved
+
+    def _remove_dir(self, key):
+        member = self._entries.pop(key)
+        del self._dirs[key]
+        self._dirs[posixpath.dirname(key) or "."].remove(member)
+
+    def _remove_dirs(self, key):
+        # Like os.removedirs: remove key, then each parent that became
+        # empty, stopping below the root. Returns the removed paths.
+        removed = []
+        while key and not self._dirs[key]:
+            self._remove_dir(key)
+            removed.append(key)
+            key = posixpath.dirname(key)
+        return removed
+
+    def _log_action(self, action, details=None):
+        entry = {"user": self.username, "action": action, "details": details}
+        # One JSON object per line (JSON Lines).
+        if orjson is not None:
+            line = orjson.dumps(entry)
+        else:
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._log_fh.write(line + b"\n")
+
+    def _close_log(self):
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
+
+    def _get_real_path(self, path, follow_links=True):
+        # Returns the index key for path with links resolved, or None if
+        # it escapes the root.
+        if path.startswith("/"):
+            path = path.lstrip("/") or "."
+        else:
+            path = self.current_dir + "/" + path
+        path = posixpath.normpath(path)
+        if path == ".." or path.startswith("../"):
+            return None
+        return self._resolve_path(path, follow_links)
+
+    def _close_archive(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
 
     def clean_up(self):
-        if os.path.exists(self.virtual_fs_root):
-            shutil.rmtree(self.virtual_fs_root)
-            print("Temporary virtual file system removed.")
+        # Nothing is extracted to disk, so only the archive handle and the
+        # in-memory index are released.
+        self._close_archive()
+        self._entries.clear()
+        self._dirs.clear()
+        self._files.clear()
 
     def run(self):
         if self.start_script:
@@ -50,32 +249,22 @@ class ShellEmulator:
 
         while True:
             try:
-                command = input(f"{self.username}:{self.current_dir}$ ").strip()
+                command = input(self._prompt_prefix + self.current_dir + self._prompt_suffix).strip()
                 if not command:
                     continue
 
                 self._log_action("input", command)
-                parts = command.split()
-                cmd, args = parts[0], parts[1:]
+                command_id, cmd, args = self._parse(command)
 
-                if cmd == "exit":
+                if command_id == self._EXIT:
                     print("Exiting shell...")
-                    self._write_log()
+                    self._close_log()
                     self.clean_up()
                     break
-                elif cmd == "ls":
-                    self.ls(args)
-                elif cmd == "cd":
-                    self.cd(args)
-                elif cmd == "rmdir":
-                    self.rmdir(args)
-                elif cmd == "tail":
-                    self.tail(args)
-                else:
-                    print(f"Unknown command: {cmd}")
+                self._dispatch(command_id, cmd, args)
             except (KeyboardInterrupt, EOFError):
                 print("\nExiting shell...")
-                self._write_log()
+                self._close_log()
                 self.clean_up()
                 break
 
@@ -87,66 +276,123 @@ class ShellEmulator:
                     line = line.strip()
                     if line:
                         self._log_action("script_command", line)
-                        print(f"{self.username}:{self.current_dir}$ {line}")
-                        self.run_command(line)
+                        print(self._prompt_prefix + self.current_dir + self._prompt_suffix + line)
+                        self._dispatch(*self._parse(line))
         except FileNotFoundError:
             print(f"Start script not found: {script_path}")
 
-    def run_command(self, command):
-        parts = command.split()
-        cmd, args = parts[0], parts[1:]
-
-        if cmd == "ls":
-            self.ls(args)
-        elif cmd == "cd":
-            self.cd(args)
-        elif cmd == "rmdir":
-            self.rmdir(args)
-        elif cmd == "tail":
-            self.tail(args)
+    def _parse(self, command):
+        # Split off the command name first so the argument string is only
+        # tokenized when there is one.
+        parts = command.split(None, 1)
+        cmd = parts[0]
+        args = parts[1].split() if len(parts) > 1 else []
+        return self._COMMAND_IDS.get(cmd, -1), cmd, args
+
+    def _dispatch(self, command_id, cmd, args):
+        handler = self._command_handlers[command_id] if command_id >= 0 else None
+        if handler is None:
+            self._unknown(cmd, args)
         else:
-            print(f"Unknown command: {cmd}")
+            handler(args)
+
+    def _unknown(self, cmd, args):
+        print(f"Unknown command: {cmd}")
+
+    def _read_last_lines(self, f, num_lines):
+        # Only used for members that cannot be sliced from the memory map,
+        # i.e. compressed archives, where every backward seek restarts
+        # decompression. Read forward once and keep the last lines.
+        if num_lines <= 0:
+            return f.readlines()[-num_lines:]
+        return list(deque(f, maxlen=num_lines))
+
+    def _slice_last_lines(self, buf, start, end, num_lines):
+        if num_lines <= 0:
+            return b"".join(io.BytesIO(buf[start:end]).readlines()[-num_lines:])
+
+        # Find the newline before the last num_lines lines by searching
+        # backwards in place; only the returned suffix is copied.
+        pos = end - 1 if buf[end - 1:end] == b"\n" else end
+        for _ in range(num_lines):
+            pos = buf.rfind(b"\n", start, pos)
+            if pos < 0:
+                pos = start - 1
+                break
+        return buf[pos + 1:end]
+
+    def _parse_flags(self, args, value_flags=(), bool_flags=()):
+        # Single forward pass: options go to a dict (value or True), the
+        # rest stay positional. Combined boolean options such as -pv are
+        # split into single ones. Unknown or incomplete options raise
+        # ValueError.
+        flags = {}
+        positional = []
+        args = iter(args)
+        for arg in args:
+            if arg in value_flags:
+                value = next(args, None)
+                if value is None:
+                    raise ValueError(f"option requires an argument: {arg}")
+                flags[arg] = value
+            elif arg in bool_flags:
+                flags[arg] = True
+            elif len(arg) > 2 and arg[0] == "-" and all(f"-{c}" in bool_flags for c in arg[1:]):
+                for c in arg[1:]:
+                    flags[f"-{c}"] = True
+            elif arg.startswith("-") and arg != "-":
+                raise ValueError(f"invalid option: {arg}")
+            else:
+                positional.append(arg)
+        return flags, positional
 
     def ls(self, args):
-        recursive = "-R" in args
-        path = self._get_real_path(args[0] if args and args[0] != "-R" else ".")
+        try:
+            flags, paths = self._parse_flags(args, bool_flags=("-R",))
+        except ValueError:
+            print("Usage: ls [-R] [<directory>]")
+            return
 
-        if not os.path.exists(path):
-            print(f"ls: cannot access '{path}': No such file or directory")
+        recursive = "-R" in flags
+        target = paths[0] if paths else "."
+        path = self._get_real_path(target)
+
+        if path is None:
+            print(f"ls: cannot access '{target}': Permission denied")
             return
 
-        def list_directory(directory, show_header=True):
-            relative_path = directory[len(self.virtual_fs_root):] or "/"
-            if show_header:
-                print(f"{relative_path}:")
+        if path not in self._entries and path not in self._dirs:
+            print(f"ls: cannot access '{target}': No such file or directory")
+            return
 
-            try:
-                items = sorted(os.listdir(directory))
-                output = []
-                for item in items:
-                    item_path = os.path.join(directory, item)
-                    if os.path.isdir(item_path):
-                        output.append(f"{item}/")
-                    else:
-                        output.append(item)
-                print("  ".join(output) if output else "")
-                return items
-            except PermissionError:
-                print(f"ls: cannot open directory '{relative_path}': Permission denied")
-                return []
-
-        def recursive_list(directory):
-            items = list_directory(directory)
-            for item in items:
-                item_path = os.path.join(directory, item)
-                if os.path.isdir(item_path):
-                    print()
-                    recursive_list(item_path)
-
-        if recursive:
-            recursive_list(path)
-        else:
-            list_directory(path, show_header=False)
+        if path not in self._dirs:
+            print(posixpath.basename(target.rstrip("/")))
+            return
+
+        def list_directory(directory):
+            output = []
+            for entry in self._dirs[directory]:
+                name = posixpath.basename(entry.name)
+                if entry.isdir() or (entry.issym() and self._resolve_path(entry.name) in self._dirs):
+                    output.append(f"{name}/")
+                else:
+                    output.append(name)
+            return "  ".join(output)
+
+        if not recursive:
+            print(list_directory(path))
+            return
+
+        # Pre-order walk with an explicit stack; the whole listing is
+        # collected and written with a single call.
+        out = []
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            relative_path = "/" if directory == "." else f"/{directory}"
+            out.append(f"{relative_path}:\n{list_directory(directory)}\n")
+            stack.extend(entry.name for entry in reversed(self._dirs[directory]) if entry.isdir())
+        sys.stdout.write("\n".join(out))
 
     def cd(self, args):
         if not args:
@@ -156,97 +402,91 @@ class ShellEmulator:
         target_path = args[0]
         real_path = self._get_real_path(target_path)
 
-        if real_path == '.':
+        if real_path is None:
             print(f"cd: permission denied: {target_path}")
             return
 
-        if os.path.isdir(real_path):
-            self.current_dir = os.path.relpath(real_path, self.virtual_fs_root)
+        if real_path in self._dirs:
+            self.current_dir = real_path
         else:
             print(f"cd: no such file or directory: {target_path}")
 
     def rmdir(self, args):
-        if not args:
-            print("Usage: rmdir [-p] [-v] <directory>")
-            return
-
-        flags = [arg for arg in args if arg.startswith("-")]
-        paths = [arg for arg in args if not arg.startswith("-")]
+        try:
+            flags, paths = self._parse_flags(args, bool_flags=("-p", "-v"))
+        except ValueError:
+            paths = None
 
         if not paths:
             print("Usage: rmdir [-p] [-v] <directory>")
             return
 
-        target_path = self._get_real_path(paths[0])
-        if not target_path.startswith("virtual_fs"):
+        # A link to a directory is not removed through, as in rmdir(1).
+        target_path = self._get_real_path(paths[0], follow_links=False)
+        if target_path is None or target_path == ".":
             print(f"rmdir: permission denied: {paths[0]}")
             return
 
-        if not os.path.exists(target_path):
+        if target_path not in self._entries:
             print(f"rmdir: no such file or directory: {paths[0]}")
             return
 
-        if not os.path.isdir(target_path):
+        if target_path not in self._dirs:
             print(f"rmdir: {paths[0]} is not a directory")
             return
 
-        def is_empty(directory):
-            return not os.listdir(directory)
-
-        verbose = "-v" in flags
-        parent_flag = "-p" in flags
-
-        if not is_empty(target_path):
+        if self._dirs[target_path]:
             print(f"rmdir: directory not empty: {paths[0]}")
             return
 
-        try:
-            os.rmdir(target_path)
-            if verbose:
-                print(f"Removed directory: {paths[0]}")
-
-            if parent_flag:
-                parent_path = os.path.dirname(target_path)
-                while parent_path.startswith("virtual_fs") and is_empty(parent_path):
-                    os.rmdir(parent_path)
-                    if verbose:
-                        relative_parent_path = os.path.relpath(parent_path, self.virtual_fs_root)
-                        print(f"Removed parent directory: {relative_parent_path}")
-                    parent_path = os.path.dirname(parent_path)
-
-        except OSError as e:
-            print(f"rmdir: failed to remove {paths[0]}: {e}")
+        if "-p" in flags:
+            removed = self._remove_dirs(target_path)
+        else:
+            self._remove_dir(target_path)
+            removed = [target_path]
+
+        if "-v" in flags:
+            print(f"Removed directory: {paths[0]}")
+            for parent_path in removed[1:]:
+                print(f"Removed parent directory: {parent_path}")
 
     def tail(self, args):
+        try:
+            flags, args = self._parse_flags(args, value_flags=("-n",))
+            num_lines = int(flags.get("-n", 10))
+        except ValueError:
+            args = None
+
         if not args:
             print("Usage: tail [-n <number_of_lines>] <file>")
             return
 
-        num_lines = 10
-        if "-n" in args:
-            try:
-                n_index = args.index("-n")
-                num_lines = int(args[n_index + 1])
-                args = args[:n_index] + args[n_index + 2:]
-            except (IndexError, ValueError):
-                print("Usage: tail [-n <number_of_lines>] <file>")
-                return
-
         file_path = self._get_real_path(args[0])
+        member = self._entries.get(file_path)
 
-        if not os.path.exists(file_path):
+        # The root is only in _dirs, so it is checked before _entries.
+        if member is None and file_path not in self._dirs:
             print(f"tail: cannot open '{args[0]}': No such file or directory")
             return
 
-        if not os.path.isfile(file_path):
+        if member is None or not member.isreg():
             print(f"tail: {args[0]} is not a regular file")
             return
 
         try:
-            with open(file_path, "r") as f:
-                lines = f.readlines()
-                tail_lines = lines[-num_lines:]
-                print("".join(tail_lines), end="")
+            data = self._files.get(member.name)
+            if data is not None:
+                tail_data = self._slice_last_lines(data, 0, len(data), num_lines)
+            elif self._mm is not None and not member.issparse():
+                start = member.offset_data
+                tail_data = self._slice_last_lines(self._mm, start, start + member.size, num_lines)
+            else:
+                # Passing the TarInfo itself lets tarfile seek straight to the
+                # member data instead of scanning the archive by name.
+                with self._tar.extractfile(member) as f:
+                    tail_data = b"".join(self._read_last_lines(f, num_lines))
+            text = tail_data.decode("utf-8", errors="replace")
+            print(text.replace("\r\n", "\n"), end="")
         except Exception as e:
             print(f"tail: error reading '{args[0]}': {e}")
 
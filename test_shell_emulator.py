@@ -1,8 +1,13 @@
+import gc
 import unittest
+import warnings
 import os
 import shutil
 import json
 import tarfile
+from contextlib import nullcontext, redirect_stdout
+from io import StringIO
+from unittest import mock
 from main import ShellEmulator  # Импорт вашего эмулятора
 
 class TestShellEmulator(unittest.TestCase):
@@ -22,6 +27,8 @@ class TestShellEmulator(unittest.TestCase):
         os.mkdir("test_fs/non_empty_dir")
         with open("test_fs/non_empty_dir/file2.txt", "w") as f:
             f.write("Another file")
+        with open("test_fs/big.txt", "w") as f:
+            f.writelines(f"Line {i}\n" for i in range(5000))
 
         # Упаковываем её в tar
         with tarfile.open(self.virtual_fs_tar, "w") as tar:
@@ -32,6 +39,8 @@ class TestShellEmulator(unittest.TestCase):
 
     def tearDown(self):
         """Очистка после каждого теста"""
+        self.shell.clean_up()
+        self.shell._close_log()
         if os.path.exists(self.virtual_fs_tar):
             os.remove(self.virtual_fs_tar)
         if os.path.exists("test_fs"):
@@ -41,12 +50,71 @@ class TestShellEmulator(unittest.TestCase):
         if os.path.exists(self.log_file):
             os.remove(self.log_file)
 
+    def _pack(self, tar_path, mode="w", extra=()):
+        """Упаковывает test_fs и дополнительные записи TarInfo в архив"""
+        with tarfile.open(tar_path, mode) as tar:
+            tar.add("test_fs", arcname=".")
+            for info in extra:
+                tar.addfile(info)
+        if tar_path != self.virtual_fs_tar:
+            self.addCleanup(os.remove, tar_path)
+
+    def _link(self, name, linkname, link_type=tarfile.SYMTYPE):
+        """Создаёт запись ссылки для архива"""
+        info = tarfile.TarInfo(name)
+        info.type = link_type
+        info.linkname = linkname
+        return info
+
+    def _reopen(self, tar_path=None, **patches):
+        """Пересоздаёт эмулятор для архива, подменяя настройки main"""
+        self.shell.clean_up()
+        self.shell._close_log()
+        with mock.patch.multiple("main", **patches) if patches else nullcontext():
+            self.shell = ShellEmulator(
+                self.username, tar_path or self.virtual_fs_tar, self.log_file, self.start_script
+            )
+
+    def _capture(self, *commands):
+        """Выполняет команды и возвращает их вывод"""
+        output = StringIO()
+        with redirect_stdout(output):
+            for command in commands:
+                self.shell._dispatch(*self.shell._parse(command))
+        return output.getvalue()
+
     def test_ls(self):
         """Тест команды ls"""
         self.shell.ls([])
         self.shell.ls(["non_existent_dir"])  # Ожидается сообщение об ошибке
         self.shell.ls(["-R"])  # Рекурсивный вывод
 
+    def test_ls_recursive_output(self):
+        """Тест формата вывода ls -R"""
+        self.assertEqual(
+            self._capture("ls -R"),
+            "/:\nbig.txt  empty_dir/  file1.txt  non_empty_dir/\n"
+            "\n/empty_dir:\n\n"
+            "\n/non_empty_dir:\nfile2.txt\n",
+        )
+
+    def test_parse_flags(self):
+        """Тест разбора флагов команд"""
+        flags, paths = self.shell._parse_flags(["-n", "2", "file1.txt"], value_flags=("-n",))
+        self.assertEqual((flags, paths), ({"-n": "2"}, ["file1.txt"]))
+        flags, paths = self.shell._parse_flags(["-R", "non_empty_dir"], bool_flags=("-R",))
+        self.assertEqual((flags, paths), ({"-R": True}, ["non_empty_dir"]))
+        with self.assertRaises(ValueError):
+            self.shell._parse_flags(["-n"], value_flags=("-n",))
+        with self.assertRaises(ValueError):
+            self.shell._parse_flags(["-x"], bool_flags=("-R",))
+        flags, paths = self.shell._parse_flags(["-pv", "empty_dir"], bool_flags=("-p", "-v"))
+        self.assertEqual((flags, paths), ({"-p": True, "-v": True}, ["empty_dir"]))
+        with self.assertRaises(ValueError):
+            self.shell._parse_flags(["-px"], bool_flags=("-p", "-v"))
+
+        self.assertEqual(self._capture("ls -R non_empty_dir"), "/non_empty_dir:\nfile2.txt\n")
+
     def test_cd(self):
         """Тест команды cd"""
         self.shell.cd(["empty_dir"])
@@ -54,46 +122,156 @@ class TestShellEmulator(unittest.TestCase):
         self.shell.cd([".."])
         self.assertEqual(self.shell.current_dir, ".")
         self.shell.cd(["non_existent_dir"])  # Ожидается сообщение об ошибке
+        self.shell.cd([".."])  # Выход за корень запрещён
+        self.assertEqual(self.shell.current_dir, ".")
+        self.assertIsNone(self.shell._get_real_path("empty_dir/../.."))
 
     def test_rmdir(self):
         """Тест команды rmdir"""
         self.shell.rmdir(["empty_dir"])  # Успешное удаление пустого каталога
-        self.assertFalse(os.path.exists(self.shell._get_real_path("empty_dir")))
+        self.assertNotIn(self.shell._get_real_path("empty_dir"), self.shell._entries)
 
         self.shell.rmdir(["non_empty_dir"])  # Ожидается сообщение об ошибке
-        self.assertTrue(os.path.exists(self.shell._get_real_path("non_empty_dir")))
+        self.assertIn(self.shell._get_real_path("non_empty_dir"), self.shell._entries)
 
         self.shell.rmdir(["-p", "empty_dir"])  # Удаление с родителями
 
+    def test_rmdir_parents(self):
+        """Тест rmdir -p -v для цепочки вложенных каталогов"""
+        os.makedirs("test_fs/a/b/c")
+        with open("test_fs/a/keep.txt", "w") as f:
+            f.write("keep")
+        self._pack(self.virtual_fs_tar)
+        self._reopen()
+
+        self.assertEqual(
+            self._capture("rmdir -p -v a/b/c"),
+            "Removed directory: a/b/c\nRemoved parent directory: a/b\n",
+        )
+        for path in ("a/b/c", "a/b"):
+            self.assertNotIn(path, self.shell._entries)
+            self.assertNotIn(path, self.shell._dirs)
+        # Непустой родитель останавливает удаление
+        self.assertIn("a", self.shell._dirs)
+        self.assertEqual([entry.name for entry in self.shell._dirs["a"]], ["a/keep.txt"])
+
     def test_tail(self):
         """Тест команды tail"""
         self.shell.tail(["test_fs/file1.txt"])  # Успешный вывод последних 10 строк
         self.shell.tail(["-n", "2", "test_fs/file1.txt"])  # Вывод последних 2 строк
         self.shell.tail(["non_existent_file.txt"])  # Ожидается сообщение об ошибке
+        self.assertEqual(
+            self._capture("tail .", "tail /", "tail empty_dir"),
+            "tail: . is not a regular file\n"
+            "tail: / is not a regular file\n"
+            "tail: empty_dir is not a regular file\n",
+        )
+
+    def test_tail_large_file(self):
+        """Тест tail для файла больше одного блока чтения"""
+        self.assertEqual(self._capture("tail -n 3 big.txt"), "Line 4997\nLine 4998\nLine 4999\n")
+
+    def test_tail_large_archive(self):
+        """Тест tail при чтении файлов из архива по требованию"""
+        self._reopen(SMALL_ARCHIVE_SIZE=0)
+        self.assertEqual(self.shell._files, {})
+        self.assertIsNotNone(self.shell._mm)
+        self.assertEqual(
+            self._capture("tail -n 2 file1.txt", "tail -n 1 big.txt"),
+            "Line 2\nLine 3\nLine 4999\n",
+        )
+
+    def test_tail_links(self):
+        """Тест tail для жёстких и символических ссылок"""
+        self._pack("test_links.tar", extra=[
+            self._link("sub/hard.txt", "file1.txt", tarfile.LNKTYPE),  # относительно корня архива
+            self._link("sub/link.txt", "../file1.txt"),  # относительно каталога ссылки
+        ])
+        self._reopen("test_links.tar")
+        self.assertEqual(
+            self._capture("tail -n 1 sub/hard.txt", "tail -n 1 sub/link.txt"),
+            "Line 3\nLine 3\n",
+        )
+
+    def test_symlinked_directory(self):
+        """Тест ls, cd и tail через символическую ссылку на каталог"""
+        self._pack("test_links.tar", extra=[self._link("alias", "non_empty_dir")])
+        self._reopen("test_links.tar")
+        self.assertEqual(
+            self._capture("ls", "ls alias", "tail alias/file2.txt"),
+            "alias/  big.txt  empty_dir/  file1.txt  non_empty_dir/\n"
+            "file2.txt\n"
+            "Another file",
+        )
+        self.shell.cd(["alias"])
+        self.assertEqual(self.shell.current_dir, "non_empty_dir")
+        # Сама ссылка не каталог, и rmdir не удаляет через неё
+        self.assertEqual(self._capture("rmdir /alias"), "rmdir: /alias is not a directory\n")
+
+    def test_tail_compressed_archive(self):
+        """Тест tail для сжатого архива без загрузки в память"""
+        self._pack("test_virtual_fs.tar.gz", "w:gz")
+        self._reopen("test_virtual_fs.tar.gz", SMALL_ARCHIVE_SIZE=0)
+        self.assertEqual(
+            self._capture("tail -n 2 file1.txt", "tail -n 1 big.txt"),
+            "Line 2\nLine 3\nLine 4999\n",
+        )
+        # Окно из многих блоков распаковки читается целиком и по порядку
+        expected = "".join(f"Line {i}\n" for i in range(1000, 5000))
+        self.assertEqual(self._capture("tail -n 4000 big.txt"), expected)
+
+    def test_mislabeled_archive(self):
+        """Тест архива, расширение которого не совпадает с форматом"""
+        self._pack("test_mislabeled.tar", "w:gz")
+        self._reopen("test_mislabeled.tar")
+        self.assertEqual(self._capture("tail -n 1 file1.txt"), "Line 3\n")
+
+    def test_missing_archive_keeps_log(self):
+        """Ошибка открытия архива не затирает предыдущий лог"""
+        self.shell._close_log()
+        with open(self.log_file, "w") as log:
+            log.write("previous\n")
+        with self.assertRaises(FileNotFoundError):
+            ShellEmulator(self.username, "missing.tar", self.log_file, self.start_script)
+        with open(self.log_file) as log:
+            self.assertEqual(log.read(), "previous\n")
+
+    def test_truncated_archive_closes_file(self):
+        """Повреждённый архив не оставляет открытых файлов"""
+        self._pack("test_truncated.tar.gz", "w:gz")
+        with open("test_truncated.tar.gz", "r+b") as f:
+            f.truncate(os.path.getsize("test_truncated.tar.gz") // 2)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            with self.assertRaises((tarfile.TarError, EOFError)) as raised:
+                self._reopen("test_truncated.tar.gz", SMALL_ARCHIVE_SIZE=0)
+            raised.exception.__traceback__ = None
+            gc.collect()
+        self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
 
     def test_exit(self):
         """Тест команды exit"""
         self.shell.clean_up()
         self.assertFalse(os.path.exists(self.virtual_fs_dir))
+        self.assertEqual(self.shell._entries, {})
 
     def test_logging(self):
         """Проверка логирования действий"""
         self.shell.ls([])
         self.shell._log_action("input", f"{self.username}:{self.shell.current_dir}$ ")
-        self.shell._write_log()
         self.shell.cd(["empty_dir"])
         self.shell._log_action("input", f"{self.username}:{self.shell.current_dir}$ ")
-        self.shell._write_log()
         self.shell.rmdir(["empty_dir"])
         self.shell._log_action("input", f"{self.username}:{self.shell.current_dir}$ ")
-        self.shell._write_log()
         self.shell.tail(["test_fs/file1.txt"])
         self.shell._log_action("input", f"{self.username}:{self.shell.current_dir}$ ")
-        self.shell._write_log()
 
-        # Чтение логов из файла
+        self.shell._close_log()
+
+        # Чтение логов из файла (одна JSON-запись на строку)
         with open(self.log_file, "r") as log:
-            log_data = json.load(log)
+            log_data = [json.loads(line) for line in log]
 
         # Проверка длины и содержания логов
         self.assertEqual(len(log_data), 4)  # Ожидается 4 записи